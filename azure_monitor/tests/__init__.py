@@ -1,2 +1,19 @@
 # Copyright (c) Microsoft Corporation. All rights reserved.
 # Licensed under the MIT License.
+
+import os
+import tempfile
+
+
+def get_test_folder(name):
+    """Folder for the storage a test module writes to.
+
+    Prefer a memory-backed filesystem, falling back to the platform temp
+    directory (e.g. %TEMP% on Windows). The folder is per process so
+    parallel workers never share it; modules remove it in setUpModule in
+    case an interrupted run with the same pid left stale blobs behind.
+    """
+    return os.path.join(
+        "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(),
+        "azmon_test_{}_{}".format(name, os.getpid()),
+    )
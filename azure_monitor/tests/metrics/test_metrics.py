@@ -35,12 +35,15 @@ from azure_monitor.protocol import (
 )
 from azure_monitor.utils import azure_monitor_context
 
-TEST_FOLDER = os.path.abspath(".test")
+from .. import get_test_folder
+
+TEST_FOLDER = get_test_folder("metrics")
 STORAGE_PATH = os.path.join(TEST_FOLDER)
 
 
 # pylint: disable=invalid-name
 def setUpModule():
+    shutil.rmtree(TEST_FOLDER, ignore_errors=True)
     os.makedirs(TEST_FOLDER)
 
 
@@ -85,15 +88,14 @@ class TestAzureMetricsExporter(unittest.TestCase):
         cls._test_labels = tuple({"environment": "staging"}.items())
 
     def setUp(self):
-        for filename in os.listdir(STORAGE_PATH):
-            file_path = os.path.join(STORAGE_PATH, filename)
+        for entry in os.scandir(STORAGE_PATH):
             try:
-                if os.path.isfile(file_path) or os.path.islink(file_path):
-                    os.unlink(file_path)
-                elif os.path.isdir(file_path):
-                    shutil.rmtree(file_path)
+                if entry.is_file() or entry.is_symlink():
+                    os.unlink(entry.path)
+                elif entry.is_dir():
+                    shutil.rmtree(entry.path)
             except OSError as e:
-                print("Failed to delete %s. Reason: %s" % (file_path, e))
+                print("Failed to delete %s. Reason: %s" % (entry.path, e))
 
     @classmethod
     def tearDownClass(cls):
@@ -4,6 +4,7 @@
 import json
 import os
 import shutil
+import time
 import unittest
 from unittest import mock
 
@@ -20,12 +21,23 @@ from azure_monitor.export import (
 from azure_monitor.options import ExporterOptions
 from azure_monitor.protocol import Data, Envelope
 
-TEST_FOLDER = os.path.abspath(".test")
-STORAGE_PATH = os.path.join(TEST_FOLDER)
+from . import get_test_folder
+
+TEST_FOLDER = get_test_folder("base_exporter")
+STORAGE_PATH = os.path.join(TEST_FOLDER, "TestBaseExporter")
+# Storage only needs JSON-serializable items, skip the protocol model layer
+_EMPTY_ENVELOPE_DICT = {
+    "ver": 1,
+    "name": "",
+    "time": "",
+    "iKey": "",
+    "data": None,
+}
 
 
 # pylint: disable=invalid-name
 def setUpModule():
+    shutil.rmtree(TEST_FOLDER, ignore_errors=True)
     os.makedirs(TEST_FOLDER)
 
 
@@ -34,11 +46,97 @@ def tearDownModule():
     shutil.rmtree(TEST_FOLDER)
 
 
-def throw(exc_type, *args, **kwargs):
-    def func(*_args, **_kwargs):
-        raise exc_type(*args, **kwargs)
+def _one_envelope():
+    return [dict(_EMPTY_ENVELOPE_DICT)]
+
+
+class MockResponse:
+    __slots__ = ("status_code", "text")
+
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.text = text
+
+
+_RESP_200_UNKNOWN = MockResponse(200, "unknown")
+_RESP_206_UNKNOWN = MockResponse(206, "unknown")
+_RESP_400 = MockResponse(400, "{}")
+_RESP_439 = MockResponse(439, "{}")
+_RESP_500 = MockResponse(500, "{}")
+
+_BODY_206_500 = json.dumps(
+    {
+        "itemsReceived": 5,
+        "itemsAccepted": 3,
+        "errors": [
+            {"index": 0, "statusCode": 400, "message": ""},
+            {
+                "index": 2,
+                "statusCode": 500,
+                "message": "Internal Server Error",
+            },
+        ],
+    }
+)
+
+_BODY_206_NO_RETRY = json.dumps(
+    {
+        "itemsReceived": 3,
+        "itemsAccepted": 2,
+        "errors": [{"index": 0, "statusCode": 400, "message": ""}],
+    }
+)
+
+_BODY_206_BOGUS = json.dumps(
+    {"itemsReceived": 5, "itemsAccepted": 3, "errors": [{"foo": 0, "bar": 1}]}
+)
+
+
+class InMemoryBlob:
+    def __init__(self, storage, data):
+        self._storage = storage
+        self._data = tuple(data)
+        self.leased_until = 0
+
+    def delete(self):
+        self._storage.remove(self)
+
+    def get(self):
+        return self._data
 
-    return func
+    def lease(self, period):
+        self.leased_until = time.time() + period
+        return self
+
+
+class InMemoryStorage:
+    """In-memory stand-in for LocalFileStorage in transmission tests."""
+
+    def __init__(self):
+        self._blobs = []
+
+    def gets(self):
+        now = time.time()
+        # iterate over a snapshot, blobs may be deleted or added meanwhile
+        for blob in list(self._blobs):
+            if blob.leased_until <= now:
+                yield blob
+
+    def get(self):
+        return next(self.gets(), None)
+
+    def put(self, data, lease_period=0):
+        blob = InMemoryBlob(self, data)
+        if lease_period:
+            blob.lease(lease_period)
+        self._blobs.append(blob)
+        return blob
+
+    def remove(self, blob):
+        self._blobs.remove(blob)
+
+    def count(self):
+        return len(self._blobs)
 
 
 # pylint: disable=W0212
@@ -46,21 +144,28 @@ def throw(exc_type, *args, **kwargs):
 class TestBaseExporter(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
-        os.environ[
-            "APPINSIGHTS_INSTRUMENTATIONKEY"
-        ] = "1234abcd-5678-4efa-8abc-1234567890ab"
+        cls._environ_patcher = mock.patch.dict(
+            os.environ,
+            {
+                "APPINSIGHTS_INSTRUMENTATIONKEY": "1234abcd-5678-4efa-8abc-1234567890ab"
+            },
+        )
+        cls._environ_patcher.start()
         cls._base = BaseExporter(storage_path=STORAGE_PATH)
+        cls._post_patcher = mock.patch("requests.post")
+        cls._post = cls._post_patcher.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._post_patcher.stop()
+        cls._environ_patcher.stop()
 
     def setUp(self):
-        for filename in os.listdir(STORAGE_PATH):
-            file_path = os.path.join(STORAGE_PATH, filename)
-            try:
-                if os.path.isfile(file_path) or os.path.islink(file_path):
-                    os.unlink(file_path)
-                elif os.path.isdir(file_path):
-                    shutil.rmtree(file_path)
-            except OSError as e:
-                print("Failed to delete %s. Reason: %s" % (file_path, e))
+        # reset_mock only resets return_value/side_effect from Python 3.6
+        self._post.reset_mock()
+        self._post.return_value = mock.DEFAULT
+        self._post.side_effect = None
+        self._base.storage = InMemoryStorage()
         self._base.clear_telemetry_processors()
 
     def test_constructor(self):
@@ -163,203 +268,82 @@ class TestBaseExporter(unittest.TestCase):
         self.assertEqual(envelopes[0].data.base_type, "type2")
 
     def test_transmission_nothing(self):
-        exporter = BaseExporter(
-            storage_path=os.path.join(TEST_FOLDER, self.id())
-        )
-        with mock.patch("requests.post") as post:
-            post.return_value = None
-            exporter._transmit_from_storage()
+        exporter = self._base
+        self._post.return_value = None
+        exporter._transmit_from_storage()
 
     def test_transmit_request_timeout(self):
-        exporter = BaseExporter(
-            storage_path=os.path.join(TEST_FOLDER, self.id())
-        )
-        envelopes_to_export = map(lambda x: x.to_dict(), tuple([Envelope()]))
-        exporter.storage.put(envelopes_to_export)
-        with mock.patch("requests.post", throw(requests.Timeout)):
-            exporter._transmit_from_storage()
+        exporter = self._base
+        exporter.storage.put(_one_envelope())
+        self._post.side_effect = requests.Timeout
+        exporter._transmit_from_storage()
         self.assertIsNone(exporter.storage.get())
-        self.assertEqual(len(os.listdir(exporter.storage.path)), 1)
+        self.assertEqual(exporter.storage.count(), 1)
 
     def test_transmit_request_exception(self):
-        exporter = BaseExporter(
-            storage_path=os.path.join(TEST_FOLDER, self.id())
-        )
-        envelopes_to_export = map(lambda x: x.to_dict(), tuple([Envelope()]))
-        exporter.storage.put(envelopes_to_export)
-        with mock.patch("requests.post", throw(Exception)):
-            exporter._transmit_from_storage()
+        exporter = self._base
+        exporter.storage.put(_one_envelope())
+        self._post.side_effect = Exception
+        exporter._transmit_from_storage()
         self.assertIsNone(exporter.storage.get())
-        self.assertEqual(len(os.listdir(exporter.storage.path)), 1)
+        self.assertEqual(exporter.storage.count(), 1)
 
-    @mock.patch("requests.post", return_value=mock.Mock())
-    def test_transmission_lease_failure(self, requests_mock):
-        requests_mock.return_value = MockResponse(200, "unknown")
-        exporter = BaseExporter(
-            storage_path=os.path.join(TEST_FOLDER, self.id())
-        )
-        envelopes_to_export = map(lambda x: x.to_dict(), tuple([Envelope()]))
-        exporter.storage.put(envelopes_to_export)
-        with mock.patch(
-            "azure_monitor.storage.LocalFileBlob.lease"
-        ) as lease:  # noqa: E501
+    def test_transmission_lease_failure(self):
+        exporter = self._base
+        self._post.return_value = _RESP_200_UNKNOWN
+        exporter.storage.put(_one_envelope())
+        with mock.patch.object(InMemoryBlob, "lease") as lease:
             lease.return_value = False
             exporter._transmit_from_storage()
         self.assertTrue(exporter.storage.get())
 
     def test_transmission(self):
-        exporter = BaseExporter(
-            storage_path=os.path.join(TEST_FOLDER, self.id())
-        )
-        envelopes_to_export = map(lambda x: x.to_dict(), tuple([Envelope()]))
-        exporter.storage.put(envelopes_to_export)
-        with mock.patch("requests.post") as post:
-            post.return_value = MockResponse(200, None)
-            del post.return_value.text
-            exporter._transmit_from_storage()
+        exporter = self._base
+        exporter.storage.put(_one_envelope())
+        self._post.return_value = MockResponse(200, None)
+        del self._post.return_value.text
+        exporter._transmit_from_storage()
         self.assertIsNone(exporter.storage.get())
-        self.assertEqual(len(os.listdir(exporter.storage.path)), 0)
-
-    def test_transmission_200(self):
-        exporter = BaseExporter(
-            storage_path=os.path.join(TEST_FOLDER, self.id())
+        self.assertEqual(exporter.storage.count(), 0)
+
+    def test_transmission_matrix(self):
+        cases = (
+            ("200", _RESP_200_UNKNOWN, 0),
+            ("206", _RESP_206_UNKNOWN, 1),
+            ("206_no_retry", MockResponse(206, _BODY_206_NO_RETRY), 0),
+            ("206_bogus", MockResponse(206, _BODY_206_BOGUS), 0),
+            ("400", _RESP_400, 0),
+            ("439", _RESP_439, 1),
+            ("500", _RESP_500, 1),
         )
-        envelopes_to_export = map(lambda x: x.to_dict(), tuple([Envelope()]))
-        exporter.storage.put(envelopes_to_export)
-        with mock.patch("requests.post") as post:
-            post.return_value = MockResponse(200, "unknown")
-            exporter._transmit_from_storage()
-        self.assertIsNone(exporter.storage.get())
-        self.assertEqual(len(os.listdir(exporter.storage.path)), 0)
-
-    def test_transmission_206(self):
-        exporter = BaseExporter(
-            storage_path=os.path.join(TEST_FOLDER, self.id())
-        )
-        envelopes_to_export = map(lambda x: x.to_dict(), tuple([Envelope()]))
-        exporter.storage.put(envelopes_to_export)
-        with mock.patch("requests.post") as post:
-            post.return_value = MockResponse(206, "unknown")
-            exporter._transmit_from_storage()
-        self.assertIsNone(exporter.storage.get())
-        self.assertEqual(len(os.listdir(exporter.storage.path)), 1)
+        exporter = self._base
+        for name, response, blob_count in cases:
+            with self.subTest(case=name):
+                exporter.storage = InMemoryStorage()
+                exporter.storage.put(_one_envelope())
+                self._post.return_value = response
+                exporter._transmit_from_storage()
+                self.assertIsNone(exporter.storage.get())
+                self.assertEqual(exporter.storage.count(), blob_count)
 
     def test_transmission_206_500(self):
-        exporter = BaseExporter(
-            storage_path=os.path.join(TEST_FOLDER, self.id())
+        exporter = self._base
+        exporter.storage.put(
+            [
+                dict(_EMPTY_ENVELOPE_DICT),
+                dict(_EMPTY_ENVELOPE_DICT),
+                {**_EMPTY_ENVELOPE_DICT, "name": "testEnvelope"},
+            ]
         )
-        test_envelope = Envelope(name="testEnvelope")
-        envelopes_to_export = map(
-            lambda x: x.to_dict(),
-            tuple([Envelope(), Envelope(), test_envelope]),
-        )
-        exporter.storage.put(envelopes_to_export)
-        with mock.patch("requests.post") as post:
-            post.return_value = MockResponse(
-                206,
-                json.dumps(
-                    {
-                        "itemsReceived": 5,
-                        "itemsAccepted": 3,
-                        "errors": [
-                            {"index": 0, "statusCode": 400, "message": ""},
-                            {
-                                "index": 2,
-                                "statusCode": 500,
-                                "message": "Internal Server Error",
-                            },
-                        ],
-                    }
-                ),
-            )
-            exporter._transmit_from_storage()
-        self.assertEqual(len(os.listdir(exporter.storage.path)), 1)
+        self._post.return_value = MockResponse(206, _BODY_206_500)
+        exporter._transmit_from_storage()
+        self.assertEqual(exporter.storage.count(), 1)
         self.assertEqual(
             exporter.storage.get().get()[0]["name"], "testEnvelope"
         )
 
-    def test_transmission_206_no_retry(self):
-        exporter = BaseExporter(
-            storage_path=os.path.join(TEST_FOLDER, self.id())
-        )
-        envelopes_to_export = map(lambda x: x.to_dict(), tuple([Envelope()]))
-        exporter.storage.put(envelopes_to_export)
-        with mock.patch("requests.post") as post:
-            post.return_value = MockResponse(
-                206,
-                json.dumps(
-                    {
-                        "itemsReceived": 3,
-                        "itemsAccepted": 2,
-                        "errors": [
-                            {"index": 0, "statusCode": 400, "message": ""}
-                        ],
-                    }
-                ),
-            )
-            exporter._transmit_from_storage()
-        self.assertEqual(len(os.listdir(exporter.storage.path)), 0)
-
-    def test_transmission_206_bogus(self):
-        exporter = BaseExporter(
-            storage_path=os.path.join(TEST_FOLDER, self.id())
-        )
-        envelopes_to_export = map(lambda x: x.to_dict(), tuple([Envelope()]))
-        exporter.storage.put(envelopes_to_export)
-        with mock.patch("requests.post") as post:
-            post.return_value = MockResponse(
-                206,
-                json.dumps(
-                    {
-                        "itemsReceived": 5,
-                        "itemsAccepted": 3,
-                        "errors": [{"foo": 0, "bar": 1}],
-                    }
-                ),
-            )
-            exporter._transmit_from_storage()
-        self.assertIsNone(exporter.storage.get())
-        self.assertEqual(len(os.listdir(exporter.storage.path)), 0)
-
-    def test_transmission_400(self):
-        exporter = BaseExporter(
-            storage_path=os.path.join(TEST_FOLDER, self.id())
-        )
-        envelopes_to_export = map(lambda x: x.to_dict(), tuple([Envelope()]))
-        exporter.storage.put(envelopes_to_export)
-        with mock.patch("requests.post") as post:
-            post.return_value = MockResponse(400, "{}")
-            exporter._transmit_from_storage()
-        self.assertEqual(len(os.listdir(exporter.storage.path)), 0)
-
-    def test_transmission_439(self):
-        exporter = BaseExporter(
-            storage_path=os.path.join(TEST_FOLDER, self.id())
-        )
-        envelopes_to_export = map(lambda x: x.to_dict(), tuple([Envelope()]))
-        exporter.storage.put(envelopes_to_export)
-        with mock.patch("requests.post") as post:
-            post.return_value = MockResponse(439, "{}")
-            exporter._transmit_from_storage()
-        self.assertIsNone(exporter.storage.get())
-        self.assertEqual(len(os.listdir(exporter.storage.path)), 1)
-
-    def test_transmission_500(self):
-        exporter = BaseExporter(
-            storage_path=os.path.join(TEST_FOLDER, self.id())
-        )
-        envelopes_to_export = map(lambda x: x.to_dict(), tuple([Envelope()]))
-        exporter.storage.put(envelopes_to_export)
-        with mock.patch("requests.post") as post:
-            post.return_value = MockResponse(500, "{}")
-            exporter._transmit_from_storage()
-        self.assertIsNone(exporter.storage.get())
-        self.assertEqual(len(os.listdir(exporter.storage.path)), 1)
-
     def test_transmission_empty(self):
-        exporter = BaseExporter(
-            storage_path=os.path.join(TEST_FOLDER, self.id())
-        )
+        exporter = self._base
         status = exporter._transmit([])
         self.assertEqual(status, ExportResult.SUCCESS)
 
@@ -392,9 +376,3 @@ class TestBaseExporter(unittest.TestCase):
             MetricsExportResult.FAILURE,
         )
         self.assertEqual(get_metrics_export_result(None), None)
-
-
-class MockResponse:
-    def __init__(self, status_code, text):
-        self.status_code = status_code
-        self.text = text
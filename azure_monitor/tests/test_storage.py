@@ -13,11 +13,14 @@ from azure_monitor.storage import (
     _seconds,
 )
 
-TEST_FOLDER = os.path.abspath(".test")
+from . import get_test_folder
+
+TEST_FOLDER = get_test_folder("storage")
 
 
 # pylint: disable=invalid-name
 def setUpModule():
+    shutil.rmtree(TEST_FOLDER, ignore_errors=True)
     os.makedirs(TEST_FOLDER)
 
 
@@ -20,14 +20,233 @@ from azure_monitor.export.trace import (
     indicate_processed_by_metric_extractors,
 )
 from azure_monitor.options import ExporterOptions
+from azure_monitor.storage import LocalFileStorage
 
-TEST_FOLDER = os.path.abspath(".test")
+from .. import get_test_folder
+
+# LocalFileStorage creates this folder on demand; the export tests swap in
+# a mock storage so only exporter construction touches the disk.
+TEST_FOLDER = get_test_folder("trace")
 STORAGE_PATH = os.path.join(TEST_FOLDER)
+INSTRUMENTATION_KEY = "12345678-1234-5678-abcd-12345678abcd"
+START_TIME = 1575494316027613500
+END_TIME = START_TIME + 1001000000
+TRACE_ID = 36873507687745823477771305566750195431
+SPAN_ID = 12030755672171557337
+PARENT_SPAN_ID = 12030755672171557338
+# Span contexts are immutable, share them between every span under test
+CTX = SpanContext(trace_id=TRACE_ID, span_id=SPAN_ID, is_remote=False)
+PARENT_CTX = SpanContext(
+    trace_id=TRACE_ID, span_id=PARENT_SPAN_ID, is_remote=False
+)
+_OK_STATUS = Status(canonical_code=StatusCanonicalCode.OK)
+_UNKNOWN_STATUS = Status(canonical_code=StatusCanonicalCode.UNKNOWN)
+
+_CLIENT_HTTP_200 = {
+    "component": "http",
+    "http.method": "GET",
+    "http.url": "https://www.wikipedia.org/wiki/Rabbit",
+    "http.status_code": 200,
+}
+_SERVER_HTTP_200 = {
+    "component": "http",
+    "http.method": "GET",
+    "http.path": "/wiki/Rabbit",
+    "http.route": "/wiki/Rabbit",
+    "http.url": "https://www.wikipedia.org/wiki/Rabbit",
+    "http.status_code": 200,
+}
+_SERVER_ROUTE_ATTRS = {
+    "component": "HTTP",
+    "http.method": "GET",
+    "http.route": "/wiki/Rabbit",
+    "http.path": "/wiki/Rabbitz",
+    "http.url": "https://www.wikipedia.org/wiki/Rabbit",
+    "http.status_code": 400,
+}
+
+
+def _without(attributes, *keys):
+    return {key: value for key, value in attributes.items() if key not in keys}
+
+
+# Envelope fields shared by every span built with _make_span
+_EXPECTED_ENVELOPE = {
+    "ikey": INSTRUMENTATION_KEY,
+    "parent_id": "a6f5d48acb4d31da",
+    "operation_id": "1bbd944a73a05d89eab5d3740a213ee7",
+    "operation_name": None,
+    "time": "2019-12-04T21:18:36.027613Z",
+}
+_BASE_DATA_FIELDS = {
+    "RemoteDependencyData": (
+        "name",
+        "id",
+        "result_code",
+        "duration",
+        "success",
+        "data",
+        "target",
+        "type",
+    ),
+    "RequestData": (
+        "name",
+        "id",
+        "response_code",
+        "duration",
+        "success",
+        "url",
+    ),
+}
+
+_DEPENDENCY = "Microsoft.ApplicationInsights.RemoteDependency"
+_REQUEST = "Microsoft.ApplicationInsights.Request"
+# Envelope shape per span kind, compared against _envelope_summary
+_SPAN_KIND_CASES = [
+    {
+        "name": "SpanKind.CLIENT HTTP",
+        "attrs": _CLIENT_HTTP_200,
+        "kind": SpanKind.CLIENT,
+        "parent": True,
+        "expect": {
+            "name": _DEPENDENCY,
+            "base_type": "RemoteDependencyData",
+            "base_data": {
+                "name": "GET//wiki/Rabbit",
+                "id": "a6f5d48acb4d31d9",
+                "result_code": "200",
+                "duration": "0.00:00:01.001",
+                "success": True,
+                "data": "https://www.wikipedia.org/wiki/Rabbit",
+                "target": "www.wikipedia.org",
+                "type": "HTTP",
+            },
+        },
+    },
+    {
+        "name": "SpanKind.CLIENT unknown type",
+        "attrs": {},
+        "kind": SpanKind.CLIENT,
+        "parent": True,
+        "expect": {
+            "name": _DEPENDENCY,
+            "base_type": "RemoteDependencyData",
+            "base_data": {
+                "name": "test",
+                "id": "a6f5d48acb4d31d9",
+                "result_code": "0",
+                "duration": "0.00:00:01.001",
+                "success": True,
+                "data": None,
+                "target": None,
+                "type": None,
+            },
+        },
+    },
+    {
+        "name": "SpanKind.CLIENT missing method",
+        "attrs": _without(_CLIENT_HTTP_200, "http.method"),
+        "kind": SpanKind.CLIENT,
+        "parent": True,
+        "expect": {
+            "name": _DEPENDENCY,
+            "base_type": "RemoteDependencyData",
+            "base_data": {
+                "name": "test",
+                "id": "a6f5d48acb4d31d9",
+                "result_code": "200",
+                "duration": "0.00:00:01.001",
+                "success": True,
+                "data": "https://www.wikipedia.org/wiki/Rabbit",
+                "target": "www.wikipedia.org",
+                "type": "HTTP",
+            },
+        },
+    },
+    {
+        "name": "SpanKind.SERVER HTTP - 200 request",
+        "attrs": _SERVER_HTTP_200,
+        "kind": SpanKind.SERVER,
+        "parent": True,
+        "expect": {
+            "name": _REQUEST,
+            "operation_name": "GET /wiki/Rabbit",
+            "base_type": "RequestData",
+            "base_data": {
+                "name": "GET /wiki/Rabbit",
+                "id": "a6f5d48acb4d31d9",
+                "response_code": "200",
+                "duration": "0.00:00:01.001",
+                "success": True,
+                "url": "https://www.wikipedia.org/wiki/Rabbit",
+            },
+        },
+    },
+    {
+        "name": "SpanKind.SERVER HTTP - Failed request",
+        "attrs": {**_SERVER_HTTP_200, "http.status_code": 400},
+        "kind": SpanKind.SERVER,
+        "parent": True,
+        "expect": {
+            "name": _REQUEST,
+            "operation_name": "GET /wiki/Rabbit",
+            "base_type": "RequestData",
+            "base_data": {
+                "name": "GET /wiki/Rabbit",
+                "id": "a6f5d48acb4d31d9",
+                "response_code": "400",
+                "duration": "0.00:00:01.001",
+                "success": False,
+                "url": "https://www.wikipedia.org/wiki/Rabbit",
+            },
+        },
+    },
+    {
+        "name": "SpanKind.SERVER unknown type",
+        "attrs": {**_SERVER_HTTP_200, "http.status_code": 400},
+        "kind": SpanKind.SERVER,
+        "parent": True,
+        "expect": {
+            "name": _REQUEST,
+            "operation_name": "GET /wiki/Rabbit",
+            "base_type": "RequestData",
+            "base_data": {
+                "name": "GET /wiki/Rabbit",
+                "id": "a6f5d48acb4d31d9",
+                "response_code": "400",
+                "duration": "0.00:00:01.001",
+                "success": False,
+                "url": "https://www.wikipedia.org/wiki/Rabbit",
+            },
+        },
+    },
+    {
+        "name": "SpanKind.INTERNAL",
+        "attrs": {"key1": "value1"},
+        "kind": SpanKind.INTERNAL,
+        "parent": False,
+        "expect": {
+            "name": _DEPENDENCY,
+            "parent_id": None,
+            "base_type": "RemoteDependencyData",
+            "base_data": {
+                "name": "test",
+                "id": "a6f5d48acb4d31d9",
+                "result_code": "0",
+                "duration": "0.00:00:01.001",
+                "success": True,
+                "data": None,
+                "target": None,
+                "type": "InProc",
+            },
+        },
+    },
+]
 
 
 # pylint: disable=invalid-name
 def setUpModule():
-    os.makedirs(TEST_FOLDER)
+    shutil.rmtree(TEST_FOLDER, ignore_errors=True)
 
 
 # pylint: disable=invalid-name
@@ -42,34 +261,77 @@ def throw(exc_type, *args, **kwargs):
     return func
 
 
+def _make_span(attributes, kind, links=(), parent=None, status=_OK_STATUS):
+    span = Span(
+        name="test",
+        context=CTX,
+        parent=parent,
+        sampler=None,
+        trace_config=None,
+        resource=None,
+        attributes=attributes,
+        events=None,
+        links=list(links),
+        kind=kind,
+    )
+    span.start(start_time=START_TIME)
+    span.end(end_time=END_TIME)
+    span.status = status
+    return span
+
+
+def _envelope_summary(envelope):
+    base_type = envelope.data.base_type
+    base_data = envelope.data.base_data
+    return {
+        "ikey": envelope.ikey,
+        "name": envelope.name,
+        "parent_id": envelope.tags.get("ai.operation.parentId"),
+        "operation_id": envelope.tags["ai.operation.id"],
+        "operation_name": envelope.tags.get("ai.operation.name"),
+        "time": envelope.time,
+        "base_type": base_type,
+        "base_data": {
+            field: getattr(base_data, field)
+            for field in _BASE_DATA_FIELDS[base_type]
+        },
+    }
+
+
 # pylint: disable=import-error
 # pylint: disable=protected-access
 # pylint: disable=too-many-lines
 class TestAzureExporter(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
-        os.environ.clear()
-        os.environ[
-            "APPINSIGHTS_INSTRUMENTATIONKEY"
-        ] = "1234abcd-5678-4efa-8abc-1234567890ab"
-        cls._exporter = AzureMonitorSpanExporter(storage_path=STORAGE_PATH)
+        cls._environ_patcher = mock.patch.dict(
+            os.environ,
+            {
+                "APPINSIGHTS_INSTRUMENTATIONKEY": "1234abcd-5678-4efa-8abc-1234567890ab"
+            },
+            clear=True,
+        )
+        cls._environ_patcher.start()
+        cls._exporter = AzureMonitorSpanExporter(
+            instrumentation_key=INSTRUMENTATION_KEY, storage_path=STORAGE_PATH
+        )
+        cls._parent_span = Span(name="test", context=PARENT_CTX)
+        cls._to_env = cls._exporter._span_to_envelope
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._environ_patcher.stop()
 
     def setUp(self):
-        for filename in os.listdir(STORAGE_PATH):
-            file_path = os.path.join(STORAGE_PATH, filename)
-            try:
-                if os.path.isfile(file_path) or os.path.islink(file_path):
-                    os.unlink(file_path)
-                elif os.path.isdir(file_path):
-                    shutil.rmtree(file_path)
-            except OSError as e:
-                print("Failed to delete %s. Reason: %s" % (file_path, e))
+        self._exporter.storage = mock.MagicMock(spec=LocalFileStorage)
+        self._exporter.storage.gets.return_value = []
 
     def test_constructor(self):
         """Test the constructor."""
+        storage_path = os.path.join(TEST_FOLDER, self.id())
         exporter = AzureMonitorSpanExporter(
             instrumentation_key="4321abcd-5678-4efa-8abc-1234567890ab",
-            storage_path=os.path.join(TEST_FOLDER, self.id()),
+            storage_path=storage_path,
             storage_max_size=50,
             storage_maintenance_period=100,
             storage_retention_period=200,
@@ -81,9 +343,7 @@ class TestAzureExporter(unittest.TestCase):
             exporter.options.instrumentation_key,
             "4321abcd-5678-4efa-8abc-1234567890ab",
         )
-        self.assertEqual(
-            exporter.storage.path, os.path.join(TEST_FOLDER, self.id())
-        )
+        self.assertEqual(exporter.storage.path, storage_path)
         self.assertEqual(exporter.storage.max_size, 50)
         self.assertEqual(exporter.storage.maintenance_period, 100)
         self.assertEqual(exporter.storage.retention_period, 200)
@@ -97,63 +357,56 @@ class TestAzureExporter(unittest.TestCase):
     def test_export_empty(self):
         exporter = self._exporter
         exporter.export([])
-        self.assertEqual(len(os.listdir(exporter.storage.path)), 0)
+        self.assertEqual(exporter.storage.put.call_count, 0)
 
     def test_export_failure(self):
         exporter = self._exporter
-        with mock.patch(
-            "azure_monitor.export.trace.AzureMonitorSpanExporter._transmit"
-        ) as transmit:  # noqa: E501
-            test_span = Span(
-                name="test",
-                context=SpanContext(
-                    trace_id=36873507687745823477771305566750195431,
-                    span_id=12030755672171557338,
-                    is_remote=False,
-                ),
-            )
-            test_span.start()
-            test_span.end()
-            transmit.return_value = ExportResult.FAILED_RETRYABLE
+        test_span = Span(name="test", context=PARENT_CTX)
+        test_span.start(start_time=START_TIME)
+        test_span.end(end_time=END_TIME)
+        with mock.patch.multiple(
+            "azure_monitor.export.trace.AzureMonitorSpanExporter",
+            _transmit=mock.DEFAULT,
+            _transmit_from_storage=mock.DEFAULT,
+        ) as mocks:
+            mocks["_transmit"].return_value = ExportResult.FAILED_RETRYABLE
             exporter.export([test_span])
-        self.assertEqual(len(os.listdir(exporter.storage.path)), 1)
-        self.assertIsNone(exporter.storage.get())
+        # retryable envelopes are stored leased for the result period
+        envelopes = mocks["_transmit"].call_args[0][0]
+        exporter.storage.put.assert_called_once_with(
+            envelopes, ExportResult.FAILED_RETRYABLE
+        )
+        self.assertEqual(len(envelopes), 1)
+        self.assertIsInstance(envelopes[0], dict)
+        self.assertEqual(
+            envelopes[0]["iKey"], exporter.options.instrumentation_key
+        )
+        self.assertEqual(
+            envelopes[0]["data"]["baseType"], "RemoteDependencyData"
+        )
+        self.assertEqual(mocks["_transmit_from_storage"].call_count, 0)
 
     def test_export_success(self):
         exporter = self._exporter
-        test_span = Span(
-            name="test",
-            context=SpanContext(
-                trace_id=36873507687745823477771305566750195431,
-                span_id=12030755672171557338,
-                is_remote=False,
-            ),
-        )
-        test_span.start()
-        test_span.end()
-        with mock.patch(
-            "azure_monitor.export.trace.AzureMonitorSpanExporter._transmit"
-        ) as transmit:  # noqa: E501
-            transmit.return_value = ExportResult.SUCCESS
-            storage_mock = mock.Mock()
-            exporter._transmit_from_storage = storage_mock
+        test_span = Span(name="test", context=PARENT_CTX)
+        test_span.start(start_time=START_TIME)
+        test_span.end(end_time=END_TIME)
+        with mock.patch.multiple(
+            "azure_monitor.export.trace.AzureMonitorSpanExporter",
+            _transmit=mock.DEFAULT,
+            _transmit_from_storage=mock.DEFAULT,
+        ) as mocks:
+            mocks["_transmit"].return_value = ExportResult.SUCCESS
             exporter.export([test_span])
-            self.assertEqual(len(exporter._telemetry_processors), 1)
-            self.assertEqual(storage_mock.call_count, 1)
-            self.assertEqual(len(os.listdir(exporter.storage.path)), 0)
+        self.assertEqual(len(exporter._telemetry_processors), 1)
+        self.assertEqual(mocks["_transmit_from_storage"].call_count, 1)
+        self.assertEqual(exporter.storage.put.call_count, 0)
 
     @mock.patch("azure_monitor.export.trace.logger")
     def test_export_exception(self, logger_mock):
-        test_span = Span(
-            name="test",
-            context=SpanContext(
-                trace_id=36873507687745823477771305566750195431,
-                span_id=12030755672171557338,
-                is_remote=False,
-            ),
-        )
-        test_span.start()
-        test_span.end()
+        test_span = Span(name="test", context=PARENT_CTX)
+        test_span.start(start_time=START_TIME)
+        test_span.end(end_time=END_TIME)
         exporter = self._exporter
         with mock.patch(
             "azure_monitor.export.trace.AzureMonitorSpanExporter._transmit",
@@ -165,16 +418,9 @@ class TestAzureExporter(unittest.TestCase):
 
     def test_export_not_retryable(self):
         exporter = self._exporter
-        test_span = Span(
-            name="test",
-            context=SpanContext(
-                trace_id=36873507687745823477771305566750195431,
-                span_id=12030755672171557338,
-                is_remote=False,
-            ),
-        )
-        test_span.start()
-        test_span.end()
+        test_span = Span(name="test", context=PARENT_CTX)
+        test_span.start(start_time=START_TIME)
+        test_span.end(end_time=END_TIME)
         with mock.patch(
             "azure_monitor.export.trace.AzureMonitorSpanExporter._transmit"
         ) as transmit:  # noqa: E501
@@ -203,761 +449,190 @@ class TestAzureExporter(unittest.TestCase):
         )
 
     def test_span_to_envelope_none(self):
-        exporter = self._exporter
-        self.assertIsNone(exporter._span_to_envelope(None))
+        self.assertIsNone(self._to_env(None))
 
     # pylint: disable=too-many-statements
     def test_span_to_envelope(self):
-        exporter = AzureMonitorSpanExporter(
-            instrumentation_key="12345678-1234-5678-abcd-12345678abcd",
-            storage_path=os.path.join(TEST_FOLDER, self.id()),
-        )
-
-        parent_span = Span(
-            name="test",
-            context=SpanContext(
-                trace_id=36873507687745823477771305566750195431,
-                span_id=12030755672171557338,
-                is_remote=False,
-            ),
-        )
-
-        start_time = 1575494316027613500
-        end_time = start_time + 1001000000
+        parent_span = self._parent_span
+
+        for case in _SPAN_KIND_CASES:
+            with self.subTest(case["name"]):
+                span = _make_span(
+                    case["attrs"],
+                    case["kind"],
+                    parent=parent_span if case["parent"] else None,
+                )
+                envelope = self._to_env(span)
+                self.assertEqual(
+                    _envelope_summary(envelope),
+                    {**_EXPECTED_ENVELOPE, **case["expect"]},
+                )
 
-        # SpanKind.CLIENT HTTP
-        span = Span(
-            name="test",
-            context=SpanContext(
-                trace_id=36873507687745823477771305566750195431,
-                span_id=12030755672171557337,
-                is_remote=False,
-            ),
-            parent=parent_span,
-            sampler=None,
-            trace_config=None,
-            resource=None,
-            attributes={
-                "component": "http",
-                "http.method": "GET",
-                "http.url": "https://www.wikipedia.org/wiki/Rabbit",
-                "http.status_code": 200,
-            },
-            events=None,
-            links=[],
-            kind=SpanKind.CLIENT,
-        )
-        span.start(start_time=start_time)
-        span.end(end_time=end_time)
-        span.status = Status(canonical_code=StatusCanonicalCode.OK)
-        envelope = exporter._span_to_envelope(span)
-        self.assertEqual(envelope.ikey, "12345678-1234-5678-abcd-12345678abcd")
-        self.assertEqual(
-            envelope.name, "Microsoft.ApplicationInsights.RemoteDependency"
-        )
-        self.assertEqual(
-            envelope.tags["ai.operation.parentId"], "a6f5d48acb4d31da"
-        )
-        self.assertEqual(
-            envelope.tags["ai.operation.id"],
-            "1bbd944a73a05d89eab5d3740a213ee7",
-        )
-        self.assertEqual(envelope.time, "2019-12-04T21:18:36.027613Z")
-        self.assertEqual(envelope.data.base_data.name, "GET//wiki/Rabbit")
-        self.assertEqual(
-            envelope.data.base_data.data,
-            "https://www.wikipedia.org/wiki/Rabbit",
-        )
-        self.assertEqual(envelope.data.base_data.target, "www.wikipedia.org")
-        self.assertEqual(envelope.data.base_data.id, "a6f5d48acb4d31d9")
-        self.assertEqual(envelope.data.base_data.result_code, "200")
-        self.assertEqual(envelope.data.base_data.duration, "0.00:00:01.001")
-        self.assertEqual(envelope.data.base_data.type, "HTTP")
-        self.assertEqual(envelope.data.base_type, "RemoteDependencyData")
-
-        # SpanKind.CLIENT unknown type
-        span = Span(
-            name="test",
-            context=SpanContext(
-                trace_id=36873507687745823477771305566750195431,
-                span_id=12030755672171557337,
-                is_remote=False,
-            ),
-            parent=parent_span,
-            sampler=None,
-            trace_config=None,
-            resource=None,
-            attributes={},
-            events=None,
-            links=[],
-            kind=SpanKind.CLIENT,
-        )
-        span.status = Status(canonical_code=StatusCanonicalCode.OK)
-        span.start(start_time=start_time)
-        span.end(end_time=end_time)
-        envelope = exporter._span_to_envelope(span)
-        self.assertEqual(envelope.ikey, "12345678-1234-5678-abcd-12345678abcd")
-        self.assertEqual(
-            envelope.name, "Microsoft.ApplicationInsights.RemoteDependency"
-        )
-        self.assertEqual(
-            envelope.tags["ai.operation.parentId"], "a6f5d48acb4d31da"
-        )
-        self.assertEqual(
-            envelope.tags["ai.operation.id"],
-            "1bbd944a73a05d89eab5d3740a213ee7",
-        )
-        self.assertEqual(envelope.time, "2019-12-04T21:18:36.027613Z")
-        self.assertEqual(envelope.data.base_data.name, "test")
-        self.assertEqual(envelope.data.base_data.id, "a6f5d48acb4d31d9")
-        self.assertEqual(envelope.data.base_data.duration, "0.00:00:01.001")
-        self.assertEqual(envelope.data.base_data.type, None)
-        self.assertEqual(envelope.data.base_type, "RemoteDependencyData")
-
-        # SpanKind.CLIENT missing method
-        span = Span(
-            name="test",
-            context=SpanContext(
-                trace_id=36873507687745823477771305566750195431,
-                span_id=12030755672171557337,
-                is_remote=False,
-            ),
-            parent=parent_span,
-            sampler=None,
-            trace_config=None,
-            resource=None,
-            attributes={
-                "component": "http",
-                "http.url": "https://www.wikipedia.org/wiki/Rabbit",
-                "http.status_code": 200,
-            },
-            events=None,
-            links=[],
-            kind=SpanKind.CLIENT,
-        )
-        span.status = Status(canonical_code=StatusCanonicalCode.OK)
-        span.start(start_time=start_time)
-        span.end(end_time=end_time)
-        envelope = exporter._span_to_envelope(span)
-        self.assertEqual(envelope.ikey, "12345678-1234-5678-abcd-12345678abcd")
-        self.assertEqual(
-            envelope.name, "Microsoft.ApplicationInsights.RemoteDependency"
-        )
-        self.assertEqual(
-            envelope.tags["ai.operation.parentId"], "a6f5d48acb4d31da"
-        )
-        self.assertEqual(
-            envelope.tags["ai.operation.id"],
-            "1bbd944a73a05d89eab5d3740a213ee7",
-        )
-        self.assertEqual(envelope.time, "2019-12-04T21:18:36.027613Z")
-        self.assertEqual(envelope.data.base_data.name, "test")
-        self.assertEqual(
-            envelope.data.base_data.data,
-            "https://www.wikipedia.org/wiki/Rabbit",
-        )
-        self.assertEqual(envelope.data.base_data.target, "www.wikipedia.org")
-        self.assertEqual(envelope.data.base_data.id, "a6f5d48acb4d31d9")
-        self.assertEqual(envelope.data.base_data.result_code, "200")
-        self.assertEqual(envelope.data.base_data.duration, "0.00:00:01.001")
-        self.assertEqual(envelope.data.base_data.type, "HTTP")
-        self.assertEqual(envelope.data.base_type, "RemoteDependencyData")
-
-        # SpanKind.SERVER HTTP - 200 request
-        span = Span(
-            name="test",
-            context=SpanContext(
-                trace_id=36873507687745823477771305566750195431,
-                span_id=12030755672171557337,
-                is_remote=False,
-            ),
-            parent=parent_span,
-            sampler=None,
-            trace_config=None,
-            resource=None,
-            attributes={
-                "component": "http",
-                "http.method": "GET",
-                "http.path": "/wiki/Rabbit",
-                "http.route": "/wiki/Rabbit",
-                "http.url": "https://www.wikipedia.org/wiki/Rabbit",
-                "http.status_code": 200,
-            },
-            events=None,
-            links=[],
-            kind=SpanKind.SERVER,
-        )
-        span.status = Status(canonical_code=StatusCanonicalCode.OK)
-        span.start(start_time=start_time)
-        span.end(end_time=end_time)
-        envelope = exporter._span_to_envelope(span)
-        self.assertEqual(envelope.ikey, "12345678-1234-5678-abcd-12345678abcd")
-        self.assertEqual(
-            envelope.name, "Microsoft.ApplicationInsights.Request"
-        )
-        self.assertEqual(
-            envelope.tags["ai.operation.parentId"], "a6f5d48acb4d31da"
-        )
-        self.assertEqual(
-            envelope.tags["ai.operation.id"],
-            "1bbd944a73a05d89eab5d3740a213ee7",
-        )
-        self.assertEqual(
-            envelope.tags["ai.operation.name"], "GET /wiki/Rabbit"
-        )
-        self.assertEqual(envelope.time, "2019-12-04T21:18:36.027613Z")
-        self.assertEqual(envelope.data.base_data.id, "a6f5d48acb4d31d9")
-        self.assertEqual(envelope.data.base_data.duration, "0.00:00:01.001")
-        self.assertEqual(envelope.data.base_data.response_code, "200")
-        self.assertEqual(envelope.data.base_data.name, "GET /wiki/Rabbit")
-        self.assertEqual(envelope.data.base_data.success, True)
-        self.assertEqual(
-            envelope.data.base_data.url,
-            "https://www.wikipedia.org/wiki/Rabbit",
-        )
-        self.assertEqual(envelope.data.base_type, "RequestData")
-
-        # SpanKind.SERVER HTTP - Failed request
-        span = Span(
-            name="test",
-            context=SpanContext(
-                trace_id=36873507687745823477771305566750195431,
-                span_id=12030755672171557337,
-                is_remote=False,
-            ),
-            parent=parent_span,
-            sampler=None,
-            trace_config=None,
-            resource=None,
-            attributes={
-                "component": "http",
-                "http.method": "GET",
-                "http.path": "/wiki/Rabbit",
-                "http.route": "/wiki/Rabbit",
-                "http.url": "https://www.wikipedia.org/wiki/Rabbit",
-                "http.status_code": 400,
-            },
-            events=None,
-            links=[],
-            kind=SpanKind.SERVER,
-        )
-        span.status = Status(canonical_code=StatusCanonicalCode.OK)
-        span.start(start_time=start_time)
-        span.end(end_time=end_time)
-        envelope = exporter._span_to_envelope(span)
-        self.assertEqual(envelope.ikey, "12345678-1234-5678-abcd-12345678abcd")
-        self.assertEqual(
-            envelope.name, "Microsoft.ApplicationInsights.Request"
-        )
-        self.assertEqual(
-            envelope.tags["ai.operation.parentId"], "a6f5d48acb4d31da"
-        )
-        self.assertEqual(
-            envelope.tags["ai.operation.id"],
-            "1bbd944a73a05d89eab5d3740a213ee7",
-        )
-        self.assertEqual(
-            envelope.tags["ai.operation.name"], "GET /wiki/Rabbit"
-        )
-        self.assertEqual(envelope.time, "2019-12-04T21:18:36.027613Z")
-        self.assertEqual(envelope.data.base_data.id, "a6f5d48acb4d31d9")
-        self.assertEqual(envelope.data.base_data.duration, "0.00:00:01.001")
-        self.assertEqual(envelope.data.base_data.response_code, "400")
-        self.assertEqual(envelope.data.base_data.name, "GET /wiki/Rabbit")
-        self.assertEqual(envelope.data.base_data.success, False)
-        self.assertEqual(
-            envelope.data.base_data.url,
-            "https://www.wikipedia.org/wiki/Rabbit",
-        )
-        self.assertEqual(envelope.data.base_type, "RequestData")
-
-        # SpanKind.SERVER unknown type
-        span = Span(
-            name="test",
-            context=SpanContext(
-                trace_id=36873507687745823477771305566750195431,
-                span_id=12030755672171557337,
-                is_remote=False,
-            ),
-            parent=parent_span,
-            sampler=None,
-            trace_config=None,
-            resource=None,
-            attributes={
-                "component": "http",
-                "http.method": "GET",
-                "http.path": "/wiki/Rabbit",
-                "http.route": "/wiki/Rabbit",
-                "http.url": "https://www.wikipedia.org/wiki/Rabbit",
-                "http.status_code": 400,
-            },
-            events=None,
-            links=[],
-            kind=SpanKind.SERVER,
-        )
-        span.status = Status(canonical_code=StatusCanonicalCode.OK)
-        span.start(start_time=start_time)
-        span.end(end_time=end_time)
-        envelope = exporter._span_to_envelope(span)
-        self.assertEqual(envelope.ikey, "12345678-1234-5678-abcd-12345678abcd")
-        self.assertEqual(
-            envelope.name, "Microsoft.ApplicationInsights.Request"
-        )
-        self.assertEqual(
-            envelope.tags["ai.operation.parentId"], "a6f5d48acb4d31da"
-        )
-        self.assertEqual(
-            envelope.tags["ai.operation.id"],
-            "1bbd944a73a05d89eab5d3740a213ee7",
-        )
-        self.assertEqual(envelope.time, "2019-12-04T21:18:36.027613Z")
-        self.assertEqual(envelope.data.base_data.id, "a6f5d48acb4d31d9")
-        self.assertEqual(envelope.data.base_data.duration, "0.00:00:01.001")
-        self.assertEqual(envelope.data.base_type, "RequestData")
-
-        # SpanKind.INTERNAL
-        span = Span(
-            name="test",
-            context=SpanContext(
-                trace_id=36873507687745823477771305566750195431,
-                span_id=12030755672171557337,
-                is_remote=False,
-            ),
-            parent=None,
-            sampler=None,
-            trace_config=None,
-            resource=None,
-            attributes={"key1": "value1"},
-            events=None,
-            links=[],
-            kind=SpanKind.INTERNAL,
-        )
-        span.status = Status(canonical_code=StatusCanonicalCode.OK)
-        span.start(start_time=start_time)
-        span.end(end_time=end_time)
-        envelope = exporter._span_to_envelope(span)
-        self.assertEqual(envelope.ikey, "12345678-1234-5678-abcd-12345678abcd")
-        self.assertEqual(
-            envelope.name, "Microsoft.ApplicationInsights.RemoteDependency"
-        )
-        self.assertRaises(
-            KeyError, lambda: envelope.tags["ai.operation.parentId"]
-        )
-        self.assertEqual(
-            envelope.tags["ai.operation.id"],
-            "1bbd944a73a05d89eab5d3740a213ee7",
-        )
-        self.assertEqual(envelope.time, "2019-12-04T21:18:36.027613Z")
-        self.assertEqual(envelope.data.base_data.name, "test")
-        self.assertEqual(envelope.data.base_data.duration, "0.00:00:01.001")
-        self.assertEqual(envelope.data.base_data.id, "a6f5d48acb4d31d9")
-        self.assertEqual(envelope.data.base_data.type, "InProc")
-        self.assertEqual(envelope.data.base_type, "RemoteDependencyData")
-
-        # Attributes
-        span = Span(
-            name="test",
-            context=SpanContext(
-                trace_id=36873507687745823477771305566750195431,
-                span_id=12030755672171557337,
-                is_remote=False,
-            ),
-            parent=parent_span,
-            sampler=None,
-            trace_config=None,
-            resource=None,
-            attributes={
-                "component": "http",
-                "http.method": "GET",
-                "http.url": "https://www.wikipedia.org/wiki/Rabbit",
-                "http.status_code": 200,
-                "test": "asd",
-            },
-            events=None,
-            links=[],
-            kind=SpanKind.CLIENT,
-        )
-        span.status = Status(canonical_code=StatusCanonicalCode.OK)
-        span.start(start_time=start_time)
-        span.end(end_time=end_time)
-        envelope = exporter._span_to_envelope(span)
-        self.assertEqual(len(envelope.data.base_data.properties), 2)
-        self.assertEqual(
-            envelope.data.base_data.properties["component"], "http"
-        )
-        self.assertEqual(envelope.data.base_data.properties["test"], "asd")
-
-        # Links
-        links = []
-        links.append(
-            Link(
-                context=SpanContext(
-                    trace_id=36873507687745823477771305566750195432,
-                    span_id=12030755672171557338,
-                    is_remote=False,
+        with self.subTest("Attributes"):
+            span = _make_span(
+                {**_CLIENT_HTTP_200, "test": "asd"},
+                SpanKind.CLIENT,
+                parent=parent_span,
+            )
+            base_data = self._to_env(span).data.base_data
+            self.assertEqual(len(base_data.properties), 2)
+            self.assertEqual(base_data.properties["component"], "http")
+            self.assertEqual(base_data.properties["test"], "asd")
+
+        with self.subTest("Links"):
+            links = []
+            links.append(
+                Link(
+                    context=SpanContext(
+                        trace_id=TRACE_ID + 1,
+                        span_id=PARENT_SPAN_ID,
+                        is_remote=False,
+                    )
                 )
             )
-        )
-        span = Span(
-            name="test",
-            context=SpanContext(
-                trace_id=36873507687745823477771305566750195431,
-                span_id=12030755672171557337,
-                is_remote=False,
-            ),
-            parent=parent_span,
-            sampler=None,
-            trace_config=None,
-            resource=None,
-            attributes={
-                "component": "http",
-                "http.method": "GET",
-                "http.url": "https://www.wikipedia.org/wiki/Rabbit",
-                "http.status_code": 200,
-            },
-            events=None,
-            links=links,
-            kind=SpanKind.CLIENT,
-        )
-        span.status = Status(canonical_code=StatusCanonicalCode.OK)
-        span.start(start_time=start_time)
-        span.end(end_time=end_time)
-        envelope = exporter._span_to_envelope(span)
-        self.assertEqual(len(envelope.data.base_data.properties), 2)
-        json_dict = json.loads(
-            envelope.data.base_data.properties["_MS.links"]
-        )[0]
-        self.assertEqual(json_dict["id"], "a6f5d48acb4d31da")
-
-        # Status
-        span = Span(
-            name="test",
-            context=SpanContext(
-                trace_id=36873507687745823477771305566750195431,
-                span_id=12030755672171557337,
-                is_remote=False,
-            ),
-            parent=parent_span,
-            sampler=None,
-            trace_config=None,
-            resource=None,
-            attributes={
-                "component": "http",
-                "http.method": "GET",
-                "http.url": "https://www.wikipedia.org/wiki/Rabbit",
-                "http.status_code": 500,
-            },
-            events=None,
-            links=[],
-            kind=SpanKind.SERVER,
-        )
-        span.status = Status(canonical_code=StatusCanonicalCode.OK)
-        span.start(start_time=start_time)
-        span.end(end_time=end_time)
-        envelope = exporter._span_to_envelope(span)
-        self.assertEqual(envelope.data.base_data.response_code, "500")
-        self.assertFalse(envelope.data.base_data.success)
-
-        span = Span(
-            name="test",
-            context=SpanContext(
-                trace_id=36873507687745823477771305566750195431,
-                span_id=12030755672171557337,
-                is_remote=False,
-            ),
-            parent=parent_span,
-            sampler=None,
-            trace_config=None,
-            resource=None,
-            attributes={
-                "component": "http",
-                "http.method": "GET",
-                "http.url": "https://www.wikipedia.org/wiki/Rabbit",
-                "http.status_code": 500,
-            },
-            events=None,
-            links=[],
-            kind=SpanKind.CLIENT,
-        )
-        span.status = Status(canonical_code=StatusCanonicalCode.OK)
-        span.start(start_time=start_time)
-        span.end(end_time=end_time)
-        envelope = exporter._span_to_envelope(span)
-        self.assertEqual(envelope.data.base_data.result_code, "500")
-        self.assertFalse(envelope.data.base_data.success)
-
-        span = Span(
-            name="test",
-            context=SpanContext(
-                trace_id=36873507687745823477771305566750195431,
-                span_id=12030755672171557337,
-                is_remote=False,
-            ),
-            parent=parent_span,
-            sampler=None,
-            trace_config=None,
-            resource=None,
-            attributes={
-                "component": "http",
-                "http.method": "GET",
-                "http.url": "https://www.wikipedia.org/wiki/Rabbit",
-            },
-            events=None,
-            links=[],
-            kind=SpanKind.SERVER,
-        )
-        span.status = Status(canonical_code=StatusCanonicalCode.OK)
-        span.start(start_time=start_time)
-        span.end(end_time=end_time)
-        envelope = exporter._span_to_envelope(span)
-        self.assertEqual(envelope.data.base_data.response_code, "0")
-        self.assertTrue(envelope.data.base_data.success)
-
-        span = Span(
-            name="test",
-            context=SpanContext(
-                trace_id=36873507687745823477771305566750195431,
-                span_id=12030755672171557337,
-                is_remote=False,
-            ),
-            parent=parent_span,
-            sampler=None,
-            trace_config=None,
-            resource=None,
-            attributes={
-                "component": "http",
-                "http.method": "GET",
-                "http.url": "https://www.wikipedia.org/wiki/Rabbit",
-            },
-            events=None,
-            links=[],
-            kind=SpanKind.CLIENT,
-        )
-        span.status = Status(canonical_code=StatusCanonicalCode.OK)
-        span.start(start_time=start_time)
-        span.end(end_time=end_time)
-        envelope = exporter._span_to_envelope(span)
-        self.assertEqual(envelope.data.base_data.result_code, "0")
-        self.assertTrue(envelope.data.base_data.success)
-
-        span = Span(
-            name="test",
-            context=SpanContext(
-                trace_id=36873507687745823477771305566750195431,
-                span_id=12030755672171557337,
-                is_remote=False,
-            ),
-            parent=parent_span,
-            sampler=None,
-            trace_config=None,
-            resource=None,
-            attributes={
-                "component": "http",
-                "http.method": "GET",
-                "http.url": "https://www.wikipedia.org/wiki/Rabbit",
-            },
-            events=None,
-            links=[],
-            kind=SpanKind.SERVER,
-        )
-        span.start(start_time=start_time)
-        span.end(end_time=end_time)
-        span.status = Status(canonical_code=StatusCanonicalCode.UNKNOWN)
-        envelope = exporter._span_to_envelope(span)
-        self.assertEqual(envelope.data.base_data.response_code, "2")
-        self.assertFalse(envelope.data.base_data.success)
-
-        span = Span(
-            name="test",
-            context=SpanContext(
-                trace_id=36873507687745823477771305566750195431,
-                span_id=12030755672171557337,
-                is_remote=False,
-            ),
-            parent=parent_span,
-            sampler=None,
-            trace_config=None,
-            resource=None,
-            attributes={
-                "component": "http",
-                "http.method": "GET",
-                "http.url": "https://www.wikipedia.org/wiki/Rabbit",
-            },
-            events=None,
-            links=[],
-            kind=SpanKind.CLIENT,
-        )
-        span.start(start_time=start_time)
-        span.end(end_time=end_time)
-        span.status = Status(canonical_code=StatusCanonicalCode.UNKNOWN)
-        envelope = exporter._span_to_envelope(span)
-        self.assertEqual(envelope.data.base_data.result_code, "2")
-        self.assertFalse(envelope.data.base_data.success)
-
-        # Server route attribute
-        span = Span(
-            name="test",
-            context=SpanContext(
-                trace_id=36873507687745823477771305566750195431,
-                span_id=12030755672171557337,
-                is_remote=False,
+            span = _make_span(
+                _CLIENT_HTTP_200,
+                SpanKind.CLIENT,
+                links=links,
+                parent=parent_span,
+            )
+            base_data = self._to_env(span).data.base_data
+            self.assertEqual(len(base_data.properties), 2)
+            json_dict = json.loads(base_data.properties["_MS.links"])[0]
+            self.assertEqual(json_dict["id"], "a6f5d48acb4d31da")
+
+        with self.subTest("Status - server 500"):
+            span = _make_span(
+                {**_CLIENT_HTTP_200, "http.status_code": 500},
+                SpanKind.SERVER,
+                parent=parent_span,
+            )
+            base_data = self._to_env(span).data.base_data
+            self.assertEqual(base_data.response_code, "500")
+            self.assertFalse(base_data.success)
+
+        with self.subTest("Status - client 500"):
+            span = _make_span(
+                {**_CLIENT_HTTP_200, "http.status_code": 500},
+                SpanKind.CLIENT,
+                parent=parent_span,
+            )
+            base_data = self._to_env(span).data.base_data
+            self.assertEqual(base_data.result_code, "500")
+            self.assertFalse(base_data.success)
+
+        with self.subTest("Status - server no status code"):
+            span = _make_span(
+                _without(_CLIENT_HTTP_200, "http.status_code"),
+                SpanKind.SERVER,
+                parent=parent_span,
+            )
+            base_data = self._to_env(span).data.base_data
+            self.assertEqual(base_data.response_code, "0")
+            self.assertTrue(base_data.success)
+
+        with self.subTest("Status - client no status code"):
+            span = _make_span(
+                _without(_CLIENT_HTTP_200, "http.status_code"),
+                SpanKind.CLIENT,
+                parent=parent_span,
+            )
+            base_data = self._to_env(span).data.base_data
+            self.assertEqual(base_data.result_code, "0")
+            self.assertTrue(base_data.success)
+
+        with self.subTest("Status - server unknown status"):
+            span = _make_span(
+                _without(_CLIENT_HTTP_200, "http.status_code"),
+                SpanKind.SERVER,
+                parent=parent_span,
+                status=_UNKNOWN_STATUS,
+            )
+            base_data = self._to_env(span).data.base_data
+            self.assertEqual(base_data.response_code, "2")
+            self.assertFalse(base_data.success)
+
+        with self.subTest("Status - client unknown status"):
+            span = _make_span(
+                _without(_CLIENT_HTTP_200, "http.status_code"),
+                SpanKind.CLIENT,
+                parent=parent_span,
+                status=_UNKNOWN_STATUS,
+            )
+            base_data = self._to_env(span).data.base_data
+            self.assertEqual(base_data.result_code, "2")
+            self.assertFalse(base_data.success)
+
+    def test_span_to_envelope_server_route(self):
+        url = "https://www.wikipedia.org/wiki/Rabbit"
+        cases = (
+            (
+                "route",
+                (),
+                {
+                    "name": "GET /wiki/Rabbit",
+                    "url": url,
+                    "request.name": "GET /wiki/Rabbit",
+                    "request.url": url,
+                },
             ),
-            parent=parent_span,
-            sampler=None,
-            trace_config=None,
-            resource=None,
-            attributes={
-                "component": "HTTP",
-                "http.method": "GET",
-                "http.route": "/wiki/Rabbit",
-                "http.path": "/wiki/Rabbitz",
-                "http.url": "https://www.wikipedia.org/wiki/Rabbit",
-                "http.status_code": 400,
-            },
-            events=None,
-            links=[],
-            kind=SpanKind.SERVER,
-        )
-        span.start(start_time=start_time)
-        span.end(end_time=end_time)
-        span.status = Status(canonical_code=StatusCanonicalCode.OK)
-        envelope = exporter._span_to_envelope(span)
-        self.assertEqual(
-            envelope.data.base_data.properties["request.name"],
-            "GET /wiki/Rabbit",
-        )
-        self.assertEqual(
-            envelope.data.base_data.properties["request.url"],
-            "https://www.wikipedia.org/wiki/Rabbit",
-        )
-
-        # Server method attribute missing
-        span = Span(
-            name="test",
-            context=SpanContext(
-                trace_id=36873507687745823477771305566750195431,
-                span_id=12030755672171557337,
-                is_remote=False,
+            (
+                "method missing",
+                ("http.method", "http.route"),
+                {
+                    "name": None,
+                    "url": url,
+                    "request.name": None,
+                    "request.url": url,
+                },
             ),
-            parent=parent_span,
-            sampler=None,
-            trace_config=None,
-            resource=None,
-            attributes={
-                "component": "HTTP",
-                "http.path": "/wiki/Rabbitz",
-                "http.url": "https://www.wikipedia.org/wiki/Rabbit",
-                "http.status_code": 400,
-            },
-            events=None,
-            links=[],
-            kind=SpanKind.SERVER,
-        )
-        span.start(start_time=start_time)
-        span.end(end_time=end_time)
-        span.status = Status(canonical_code=StatusCanonicalCode.OK)
-        envelope = exporter._span_to_envelope(span)
-        self.assertIsNone(envelope.data.base_data.name)
-
-        # Server route attribute missing
-        span = Span(
-            name="test",
-            context=SpanContext(
-                trace_id=36873507687745823477771305566750195431,
-                span_id=12030755672171557337,
-                is_remote=False,
+            (
+                "route missing",
+                ("http.route",),
+                {
+                    "name": "GET",
+                    "url": url,
+                    "request.name": "GET /wiki/Rabbitz",
+                    "request.url": url,
+                },
             ),
-            parent=parent_span,
-            sampler=None,
-            trace_config=None,
-            resource=None,
-            attributes={
-                "component": "HTTP",
-                "http.method": "GET",
-                "http.path": "/wiki/Rabbitz",
-                "http.url": "https://www.wikipedia.org/wiki/Rabbit",
-                "http.status_code": 400,
-            },
-            events=None,
-            links=[],
-            kind=SpanKind.SERVER,
-        )
-        span.start(start_time=start_time)
-        span.end(end_time=end_time)
-        span.status = Status(canonical_code=StatusCanonicalCode.OK)
-        envelope = exporter._span_to_envelope(span)
-        self.assertEqual(envelope.data.base_data.name, "GET")
-        self.assertEqual(
-            envelope.data.base_data.properties["request.name"],
-            "GET /wiki/Rabbitz",
-        )
-        self.assertEqual(
-            envelope.data.base_data.properties["request.url"],
-            "https://www.wikipedia.org/wiki/Rabbit",
-        )
-
-        # Server route and path attribute missing
-        span = Span(
-            name="test",
-            context=SpanContext(
-                trace_id=36873507687745823477771305566750195431,
-                span_id=12030755672171557337,
-                is_remote=False,
+            (
+                "route and path missing",
+                ("http.route", "http.path"),
+                {
+                    "name": "GET",
+                    "url": url,
+                    "request.name": None,
+                    "request.url": url,
+                },
             ),
-            parent=parent_span,
-            sampler=None,
-            trace_config=None,
-            resource=None,
-            attributes={
-                "component": "HTTP",
-                "http.method": "GET",
-                "http.url": "https://www.wikipedia.org/wiki/Rabbit",
-                "http.status_code": 400,
-            },
-            events=None,
-            links=[],
-            kind=SpanKind.SERVER,
-        )
-        span.start(start_time=start_time)
-        span.end(end_time=end_time)
-        span.status = Status(canonical_code=StatusCanonicalCode.OK)
-        envelope = exporter._span_to_envelope(span)
-        self.assertIsNone(
-            envelope.data.base_data.properties.get("request.name")
-        )
-        self.assertEqual(
-            envelope.data.base_data.properties["request.url"],
-            "https://www.wikipedia.org/wiki/Rabbit",
-        )
-
-        # Server http.url missing
-        span = Span(
-            name="test",
-            context=SpanContext(
-                trace_id=36873507687745823477771305566750195431,
-                span_id=12030755672171557337,
-                is_remote=False,
+            (
+                "url missing",
+                ("http.url",),
+                {
+                    "name": "GET /wiki/Rabbit",
+                    "url": None,
+                    "request.name": "GET /wiki/Rabbit",
+                    "request.url": None,
+                },
             ),
-            parent=parent_span,
-            sampler=None,
-            trace_config=None,
-            resource=None,
-            attributes={
-                "component": "HTTP",
-                "http.method": "GET",
-                "http.route": "/wiki/Rabbit",
-                "http.path": "/wiki/Rabbitz",
-                "http.status_code": 400,
-            },
-            events=None,
-            links=[],
-            kind=SpanKind.SERVER,
-        )
-        span.start(start_time=start_time)
-        span.end(end_time=end_time)
-        span.status = Status(canonical_code=StatusCanonicalCode.OK)
-        envelope = exporter._span_to_envelope(span)
-        self.assertIsNone(envelope.data.base_data.url)
-        self.assertIsNone(
-            envelope.data.base_data.properties.get("request.url")
         )
+        for name, removed, expected in cases:
+            with self.subTest(case=name):
+                span = _make_span(
+                    _without(_SERVER_ROUTE_ATTRS, *removed),
+                    SpanKind.SERVER,
+                    parent=self._parent_span,
+                )
+                base_data = self._to_env(span).data.base_data
+                self.assertEqual(
+                    {
+                        "name": base_data.name,
+                        "url": base_data.url,
+                        "request.name": base_data.properties.get(
+                            "request.name"
+                        ),
+                        "request.url": base_data.properties.get("request.url"),
+                    },
+                    expected,
+                )